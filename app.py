@@ -1,8 +1,14 @@
 import sys
 import types
 import os
-from typing import List, Dict, Any
-
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, TypedDict
+
+import numpy as np
+import xxhash
 from dotenv import load_dotenv
 
 # Torch shim for Windows
@@ -17,13 +23,6 @@ import streamlit as st
 # MUST BE FIRST STREAMLIT COMMAND
 st.set_page_config(layout="wide", page_title="Simple English Story Builder")
 
-import chromadb
-from chromadb.config import Settings
-
-from langgraph.graph import StateGraph, END
-from pydantic import BaseModel
-from langchain_nvidia_ai_endpoints import ChatNVIDIA, NVIDIAEmbeddings
-
 
 # =============================================================
 # CONFIG
@@ -38,29 +37,69 @@ TEMPERATURE = 0.7
 MAX_TOKENS = 200
 TOP_P = 0.9
 
+HTTP_POOL_SIZE = 32
+
+# Below this many characters a NumPy scan beats the HNSW index
+BRUTE_FORCE_MAX = 1000
+SCORE_BLOCK_ROWS = 128
+
 
 # =============================================================
 # NVIDIA CLIENTS
 # =============================================================
 
+@st.cache_resource
+def get_http_session():
+    """
+    One pooled HTTP session shared by the LLM and embedding clients.
+    Left alone, the NVIDIA clients open a new session (and a new
+    TCP/TLS connection) for every request.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def use_pooled_session(client):
+    sync_client = getattr(client, "_client", None)
+
+    if sync_client is not None and hasattr(sync_client, "get_session_fn"):
+        session = get_http_session()
+        session.verify = getattr(sync_client, "verify_ssl", True)
+        sync_client.get_session_fn = lambda: session
+
+    return client
+
+
 @st.cache_resource
 def get_llm():
     if not NVIDIA_API_KEY:
         return None
-    return ChatNVIDIA(
+
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+    return use_pooled_session(ChatNVIDIA(
         model=LLM_MODEL,
         api_key=NVIDIA_API_KEY,
         temperature=TEMPERATURE,
         max_tokens=MAX_TOKENS,
         top_p=TOP_P,
-    )
+    ))
 
 
 @st.cache_resource
 def get_embeddings():
     if not NVIDIA_API_KEY:
         return None
-    return NVIDIAEmbeddings(model=EMBED_MODEL, api_key=NVIDIA_API_KEY)
+
+    from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
+
+    return use_pooled_session(NVIDIAEmbeddings(model=EMBED_MODEL, api_key=NVIDIA_API_KEY))
 
 
 LLM = get_llm()
@@ -87,6 +126,9 @@ def init_chroma():
     Always initializes a fully persistent DB in a writable directory.
     Works on Streamlit Cloud, local machine, containers, everywhere.
     """
+    import chromadb
+    from chromadb.config import Settings
+
     db_path = get_chroma_path()
 
     client = chromadb.PersistentClient(
@@ -96,6 +138,8 @@ def init_chroma():
 
     coll = client.get_or_create_collection(
         "characters",
+        # Only collections past BRUTE_FORCE_MAX are searched through the
+        # index, so it keeps Chroma's default recall-oriented HNSW settings
         metadata={"hnsw:space": "cosine"}
     )
 
@@ -105,142 +149,442 @@ def init_chroma():
 CHROMA_CLIENT, COLLECTION = init_chroma()
 
 
+@st.cache_resource
+def get_chroma_writer():
+    """
+    Background thread for Chroma writes so saves don't block the UI.
+    A single worker keeps writes for the same character in order.
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="chroma-writer")
+
+
+def log_write_error(future):
+    if future.exception() is not None:
+        logging.getLogger(__name__).error(
+            "Chroma write failed", exc_info=future.exception()
+        )
+
+
+def submit_chroma_write(label: str, fn, **kwargs):
+    """
+    Queues a write; check_chroma_writes() reports it on a later
+    rerun if it fails.
+    """
+    future = get_chroma_writer().submit(fn, **kwargs)
+    future.add_done_callback(log_write_error)
+    st.session_state.setdefault("pending_writes", []).append((label, future))
+
+
+def check_chroma_writes() -> List[str]:
+    """
+    Collects this session's finished background writes and returns an
+    error message for each one that failed. After a failure the in-memory
+    store is reloaded from disk so it matches what was actually saved; the
+    reload is queued behind any writes still pending.
+    """
+    pending, errors = [], []
+
+    for label, future in st.session_state.get("pending_writes", []):
+        if not future.done():
+            pending.append((label, future))
+        elif future.exception() is not None:
+            errors.append(f"Could not {label}: {future.exception()}")
+
+    st.session_state["pending_writes"] = pending
+
+    if errors:
+        get_chroma_writer().submit(load_char_store, get_char_store())
+
+    return errors
+
+
+def quantize_rows(vecs) -> tuple:
+    """
+    Unit-normalizes each embedding row and stores it as int8 plus one
+    float32 scale per row, a quarter of the fp32 size. Cosine ranking
+    is unaffected in practice for top-k over a few characters.
+    """
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+    scales = np.maximum(np.abs(vecs).max(axis=1), 1e-12) / 127
+    q8 = np.clip(np.round(vecs / scales[:, None]), -127, 127).astype(np.int8)
+    return q8, scales.astype(np.float32)
+
+
+def index_with(index, name: str, description: str, vec):
+    """
+    Copy of a search index with one character added or replaced.
+    """
+    names, descs, matrix, scales = index
+    q8, scale = quantize_rows(vec)
+
+    if name in names:
+        i = names.index(name)
+        descs, matrix, scales = list(descs), matrix.copy(), scales.copy()
+        descs[i], matrix[i], scales[i] = description, q8[0], scale[0]
+        return names, descs, matrix, scales
+
+    if not names:
+        return [name], [description], q8, scale
+
+    return (
+        names + [name],
+        descs + [description],
+        np.concatenate([matrix, q8]),
+        np.concatenate([scales, scale]),
+    )
+
+
+def index_without(index, name: str):
+    """
+    Copy of a search index with one character removed.
+    """
+    names, descs, matrix, scales = index
+    if name not in names:
+        return index
+
+    i = names.index(name)
+    return (
+        names[:i] + names[i + 1:],
+        descs[:i] + descs[i + 1:],
+        np.delete(matrix, i, axis=0),
+        np.delete(scales, i),
+    )
+
+
+EMPTY_INDEX = ([], [], np.empty((0, 0), dtype=np.int8), np.empty(0, dtype=np.float32))
+
+
+def load_char_store(store):
+    from chromadb.errors import ChromaError
+
+    try:
+        # Past BRUTE_FORCE_MAX searches go to the HNSW index instead,
+        # so don't hold every embedding in memory
+        if COLLECTION.count() > BRUTE_FORCE_MAX:
+            data = COLLECTION.get(include=["documents"])
+            index = None
+        else:
+            data = COLLECTION.get(include=["documents", "embeddings"])
+            if data["ids"]:
+                matrix, scales = quantize_rows(data["embeddings"])
+                index = (list(data["ids"]), list(data["documents"]), matrix, scales)
+            else:
+                index = EMPTY_INDEX
+        docs = dict(zip(data["ids"], data["documents"]))
+    except (ChromaError, KeyError):
+        docs, index = {}, EMPTY_INDEX
+
+    with store["lock"]:
+        store["docs"] = docs
+        store["index"] = index
+
+
+@st.cache_resource
+def get_char_store():
+    """
+    Process-wide in-memory copy of the collection, shared by every session
+    so a write in one tab shows up in all of them. Loaded once, then kept
+    in sync by the write helpers while holding store["lock"].
+
+    docs:  {name: description}
+    index: (names, descriptions, int8 matrix, per-row scales) for searching,
+           or None when the collection is too large to search in memory.
+           Writes swap in a new tuple rather than mutate the old one.
+    """
+    store = {"lock": threading.Lock(), "docs": {}, "index": EMPTY_INDEX}
+    load_char_store(store)
+    return store
+
+
+def get_char_index():
+    """
+    Current search index snapshot, or None when searches should go to Chroma.
+    """
+    store = get_char_store()
+    with store["lock"]:
+        return store["index"]
+
+
 # =============================================================
 # EMBEDDING HELPERS
 # =============================================================
 
-@st.cache_data(ttl=300)
+def embed_texts_batch(texts: List[str]) -> np.ndarray:
+    """
+    Embeds all texts with a single embed_documents request
+    instead of one round-trip per text.
+    Returns a (len(texts), dim) float32 matrix.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(EMB.embed_documents(list(texts)), dtype=np.float32)
+
+
+def text_fingerprint(text: str) -> int:
+    # Case/whitespace-only edits reuse the cached embedding
+    return xxhash.xxh128_intdigest(text.strip().lower().encode())
+
+
+@st.cache_data(ttl=3600, hash_funcs={str: text_fingerprint})
 def embed_texts_cached(text: str):
-    return EMB.embed_documents([text])[0]
+    return embed_texts_batch([text])[0]
 
 
 def add_or_update_character(name: str, description: str):
     vec = embed_texts_cached(description)
+    store = get_char_store()
+
+    with store["lock"]:
+        submit_chroma_write(
+            f"save {name}",
+            COLLECTION.upsert,
+            ids=[name],
+            documents=[description],
+            embeddings=vec[None, :],
+            metadatas=[{"name": name}],
+        )
 
-    # Remove previous entry if exists
-    try:
-        COLLECTION.delete(ids=[name])
-    except:
-        pass
-
-    COLLECTION.add(
-        ids=[name],
-        documents=[description],
-        embeddings=[vec],
-        metadatas=[{"name": name}],
-    )
-
-    st.cache_data.clear()
+        store["docs"][name] = description
+        if store["index"] is not None:
+            store["index"] = index_with(store["index"], name, description, vec)
 
 
 def delete_character(name: str):
-    try:
-        COLLECTION.delete(ids=[name])
-        st.cache_data.clear()
-    except:
-        pass
+    store = get_char_store()
+
+    with store["lock"]:
+        if name not in store["docs"]:
+            return
+
+        submit_chroma_write(f"delete {name}", COLLECTION.delete, ids=[name])
+
+        del store["docs"][name]
+        if store["index"] is not None:
+            store["index"] = index_without(store["index"], name)
 
 
-@st.cache_data(ttl=60)
 def list_character_names():
-    try:
-        data = COLLECTION.get()
-        return data.get("ids", [])
-    except:
-        return []
+    store = get_char_store()
+    with store["lock"]:
+        return list(store["docs"].keys())
 
 
-@st.cache_data(ttl=60)
 def get_character_description(name: str):
-    try:
-        data = COLLECTION.get(ids=[name])
-        return data.get("documents", [""])[0]
-    except:
-        return ""
+    return get_char_store()["docs"].get(name, "")
 
 
-def search_characters(query: str, top_k: int = 3):
+def rank_by_cosine(q8_vecs: np.ndarray, scales: np.ndarray, query_vec: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Row indices of the top_k rows most similar to query_vec, best first.
+    Rows are quantize_rows() outputs: unit vectors stored as int8 * scale.
+    """
+    query_vec = query_vec / max(np.linalg.norm(query_vec), 1e-12)
+
+    # Widen a block of rows at a time so the int8 matrix is never
+    # copied to fp32 in full
+    scores = np.empty(len(q8_vecs), dtype=np.float32)
+    for start in range(0, len(q8_vecs), SCORE_BLOCK_ROWS):
+        block = q8_vecs[start:start + SCORE_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query_vec
+    scores *= scales
+
+    k = min(top_k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def search_characters(query: str, index, top_k: int = 3) -> str:
+    """
+    Returns the best matches as "- name: description" lines.
+    index is a get_char_index() snapshot; writes replace the store's
+    index rather than mutate it, so the snapshot is safe to use unlocked.
+    """
+    from chromadb.errors import ChromaError
+
     try:
+        if index is not None:
+            names, descs, matrix, scales = index
+            if not names:
+                return ""
+
+            idx = rank_by_cosine(matrix, scales, embed_texts_cached(query), top_k)
+            return "\n".join(f"- {names[i]}: {descs[i]}" for i in idx)
+
         vec = embed_texts_cached(query)
-        res = COLLECTION.query(query_embeddings=[vec], n_results=top_k)
+        res = COLLECTION.query(query_embeddings=vec[None, :], n_results=top_k)
 
         docs = res.get("documents", [[]])[0]
         metas = res.get("metadatas", [[]])[0]
 
-        return [
-            {"name": metas[i]["name"], "description": docs[i]}
-            for i in range(len(docs))
-        ]
-    except:
-        return []
+        return "\n".join(f"- {m['name']}: {d}" for d, m in zip(docs, metas))
+    except (ChromaError, KeyError, IndexError):
+        return ""
 
 
 # =============================================================
 # LANGGRAPH STATE
 # =============================================================
 
-class LGState(BaseModel):
-    prompt: str = ""
-    retrieved: str = ""
-    scene: str = ""
-    feedback: str = ""
-    scene_number: int = 1
+class LGState(TypedDict, total=False):
+    prompt: str
+    retrieved: str
+    scene: str
+    feedback: str
+    scene_number: int
 
 
 # =============================================================
 # GRAPH NODES
 # =============================================================
 
-def node_retrieve(state: LGState) -> LGState:
-    chars = search_characters(state.prompt, top_k=3)
-    state.retrieved = "\n".join([f"- {c['name']}: {c['description']}" for c in chars])
-    return state
+async def node_retrieve(state: LGState) -> LGState:
+    import requests
 
+    if "retrieved" in state:
+        return {}
 
-def make_scene_prompt(scene_number, prompt, characters):
-    return f"""Write Scene {scene_number} in simple English (120–180 words).
+    # Runs on the script thread so embed_texts_cached keeps its
+    # ScriptRunContext; there's nothing to overlap it with
+    try:
+        retrieved = search_characters(state["prompt"], get_char_index())
+    except (requests.RequestException, TimeoutError, ValueError):
+        # Network failures, polling timeouts and malformed embedding responses.
+        # Leave "retrieved" unset so the next scene retries the search.
+        return {}
 
-Characters: {characters if characters else "Create new characters as needed"}
+    return {"retrieved": retrieved}
 
-Story: {prompt}
 
+def route_entry(state: LGState) -> str:
+    # Accept & Continue carries "retrieved" over, even when the search
+    # came back empty; Regenerate and failed searches leave it unset
+    return "generate_scene" if "retrieved" in state else "retrieve"
+
+
+def make_system_prefix(prompt, characters):
+    """
+    Everything that stays the same for a whole story goes here, so every
+    scene request starts with a byte-identical prefix the server can cache.
+    """
+    return f"""Write story scenes in simple English (120–180 words).
 Use simple clear sentences.
+
+Characters: {characters if characters else "Create new characters as needed"}
+
+Story: {prompt}
 """
 
 
-def node_generate_scene(state: LGState) -> LGState:
+def make_scene_prompt(scene_number, prompt, characters):
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    return [
+        SystemMessage(content=make_system_prefix(prompt, characters)),
+        HumanMessage(content=f"Write Scene {scene_number}."),
+    ]
+
+
+def make_rewrite_prompt(scene_number, prompt, characters, scene, change):
+    """
+    Replays the scene request and its answer as chat turns, so the
+    rewrite shares the scene prompt's prefix instead of quoting the
+    scene inside a brand-new prompt.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return make_scene_prompt(scene_number, prompt, characters) + [
+        AIMessage(content=scene),
+        HumanMessage(content=f"Rewrite this scene with these changes:\n{change}"),
+    ]
+
+
+async def node_generate_scene(state: LGState, config) -> LGState:
     if LLM is None:
-        state.scene = "ERROR: LLM not initialized"
-        return state
+        return {"scene": "ERROR: LLM not initialized"}
 
     prompt_text = make_scene_prompt(
-        state.scene_number,
-        state.prompt,
-        state.retrieved,
+        state.get("scene_number", 1),
+        state["prompt"],
+        state.get("retrieved", ""),
     )
 
     try:
-        resp = LLM.invoke(prompt_text)
-        state.scene = resp.content if hasattr(resp, "content") else str(resp)
+        parts = []
+        # Forward config so stream_mode="messages" sees the tokens on Python < 3.11
+        async for chunk in LLM.astream(prompt_text, config=config):
+            parts.append(chunk.content)
+        scene = "".join(parts)
     except Exception as e:
-        state.scene = f"[Scene generation error: {e}]"
+        scene = f"[Scene generation error: {e}]"
 
-    return state
+    return {"scene": scene}
 
 
 # =============================================================
 # BUILD GRAPH
 # =============================================================
 
-graph = StateGraph(LGState)
-graph.add_node("retrieve", node_retrieve)
-graph.add_node("generate_scene", node_generate_scene)
+@st.cache_resource
+def get_workflow():
+    from langgraph.graph import StateGraph, END
+
+    graph = StateGraph(LGState)
+    graph.add_node("retrieve", node_retrieve)
+    graph.add_node("generate_scene", node_generate_scene)
+
+    graph.set_conditional_entry_point(
+        route_entry,
+        {"retrieve": "retrieve", "generate_scene": "generate_scene"},
+    )
+    graph.add_edge("retrieve", "generate_scene")
+    graph.add_edge("generate_scene", END)
+
+    return graph.compile()
+
+
+workflow = get_workflow()
+
+
+def run_workflow(state: LGState, placeholder) -> Dict[str, Any]:
+    """
+    Runs the graph on a fresh event loop and renders the scene
+    into the placeholder token by token while it is generated.
+    """
+    async def _run():
+        final = None
+        partial = ""
+        placeholder.markdown("⏳ *Writing scene...*")
+
+        async for mode, payload in workflow.astream(state, stream_mode=["messages", "values"]):
+            if mode == "messages":
+                chunk, meta = payload
+                if meta.get("langgraph_node") == "generate_scene" and chunk.content:
+                    partial += chunk.content
+                    placeholder.markdown(partial)
+            else:
+                final = payload
+
+        return dict(final)
+
+    return asyncio.run(_run())
+
+
+# =============================================================
+# STORY EXPORT
+# =============================================================
+
+@st.cache_data(ttl=3600, max_entries=64)
+def build_full_story(title: str, scenes_items: tuple) -> str:
+    full_story = "\n\n---\n\n".join(
+        f"Scene {k}\n\n{scene}" for k, scene in scenes_items
+    )
 
-graph.set_entry_point("retrieve")
-graph.add_edge("retrieve", "generate_scene")
-graph.add_edge("generate_scene", END)
+    if title:
+        full_story = f"{title}\n\n{full_story}"
 
-workflow = graph.compile()
+    return full_story
 
 
 # =============================================================
@@ -274,6 +618,9 @@ if "edit_char" not in st.session_state:
 with st.sidebar:
     st.header("📚 Character Database")
 
+    for err in check_chroma_writes():
+        st.error(err)
+
     names = list_character_names()
 
     if names:
@@ -343,21 +690,24 @@ with st.sidebar:
 st.header("📝 Build Stories with Your Characters")
 
 story_title = st.text_input("Story Title (optional):")
-prompt_text = st.text_area("Story Prompt:", height=120)
 
-if st.button("🚀 Generate Scene 1", type="primary"):
+# A form so typing the prompt doesn't rerun the script per keystroke
+with st.form("new_story", clear_on_submit=False):
+    prompt_text = st.text_area("Story Prompt:", height=120)
+
+    generate = st.form_submit_button("🚀 Generate Scene 1", type="primary")
+
+if generate:
     if not prompt_text.strip():
         st.error("Enter a story prompt first.")
     else:
-        with st.spinner("Generating scene 1..."):
-            init_state = LGState(prompt=prompt_text.strip(), scene_number=1)
-            result = workflow.invoke(init_state)
-            rd = dict(result)
+        init_state = LGState(prompt=prompt_text.strip(), scene_number=1)
+        rd = run_workflow(init_state, st.empty())
 
-            st.session_state["lg_state"] = rd
-            st.session_state["scenes"] = {1: rd["scene"]}
+        st.session_state["lg_state"] = rd
+        st.session_state["scenes"] = {1: rd["scene"]}
 
-            st.rerun()
+        st.rerun()
 
 # --------------------------------------------------------------
 # SHOW CURRENT SCENE
@@ -373,7 +723,8 @@ if st.session_state["lg_state"]:
     if story_title:
         st.markdown(f"### **{story_title}**")
 
-    st.markdown(s["scene"])
+    scene_placeholder = st.empty()
+    scene_placeholder.markdown(s["scene"])
 
     st.markdown("---")
 
@@ -386,62 +737,65 @@ if st.session_state["lg_state"]:
         else:
             next_state = LGState(
                 prompt=s["prompt"],
-                retrieved=s["retrieved"],
                 scene_number=sn + 1
             )
+            if "retrieved" in s:
+                next_state["retrieved"] = s["retrieved"]
 
-            with st.spinner(f"Generating scene {sn+1}..."):
-                result = workflow.invoke(next_state)
-                rd = dict(result)
+            rd = run_workflow(next_state, scene_placeholder)
 
-                st.session_state["lg_state"] = rd
-                st.session_state["scenes"][sn + 1] = rd["scene"]
-                st.rerun()
+            st.session_state["lg_state"] = rd
+            st.session_state["scenes"][sn + 1] = rd["scene"]
+            st.rerun()
 
     # REGENERATE
     if col2.button("🔄 Regenerate Scene"):
+        # No "retrieved": pick up characters added or edited since
         current_state = LGState(
             prompt=s["prompt"],
-            retrieved=s["retrieved"],
             scene_number=sn
         )
 
-        with st.spinner("Regenerating..."):
-            result = workflow.invoke(current_state)
-            rd = dict(result)
+        rd = run_workflow(current_state, scene_placeholder)
 
-            st.session_state["lg_state"] = rd
-            st.session_state["scenes"][sn] = rd["scene"]
-            st.rerun()
+        st.session_state["lg_state"] = rd
+        st.session_state["scenes"][sn] = rd["scene"]
+        st.rerun()
 
     # CUSTOM CHANGES
     with st.expander("✏️ Make Custom Changes"):
-        change = st.text_area("Describe changes:")
-
-        if st.button("Apply Changes", type="primary"):
-            rewrite_prompt = f"""Rewrite this scene with these changes:
-{change}
-
-Original:
-{s["scene"]}
-
-Rewritten scene:
-"""
-
-            with st.spinner("Rewriting..."):
-                resp = LLM.invoke(rewrite_prompt)
-                new_scene = resp.content if hasattr(resp, "content") else str(resp)
-
-                new_state = {
-                    "prompt": s["prompt"],
-                    "retrieved": s["retrieved"],
-                    "scene": new_scene,
-                    "scene_number": sn,
-                }
+        with st.form("custom_changes", clear_on_submit=False):
+            change = st.text_area("Describe changes:")
+            apply_changes = st.form_submit_button("Apply Changes", type="primary")
+
+        if apply_changes:
+            rewrite_prompt = make_rewrite_prompt(
+                sn,
+                s["prompt"],
+                s.get("retrieved", ""),
+                s["scene"],
+                change,
+            )
 
-                st.session_state["lg_state"] = new_state
-                st.session_state["scenes"][sn] = new_scene
-                st.rerun()
+            buf = []
+            scene_placeholder.markdown("⏳ *Rewriting scene...*")
+            for chunk in LLM.stream(rewrite_prompt):
+                if chunk.content:
+                    buf.append(chunk.content)
+                    scene_placeholder.markdown("".join(buf))
+            new_scene = "".join(buf)
+
+            new_state = {
+                "prompt": s["prompt"],
+                "scene": new_scene,
+                "scene_number": sn,
+            }
+            if "retrieved" in s:
+                new_state["retrieved"] = s["retrieved"]
+
+            st.session_state["lg_state"] = new_state
+            st.session_state["scenes"][sn] = new_scene
+            st.rerun()
 
 
 # =============================================================
@@ -458,13 +812,11 @@ if len(st.session_state["scenes"]) > 1:
 
     if len(st.session_state["scenes"]) == MAX_SCENES:
         st.markdown("---")
-        full_story = "\n\n---\n\n".join(
-            [f"Scene {k}\n\n{st.session_state['scenes'][k]}" for k in sorted(st.session_state["scenes"].keys())]
+        full_story = build_full_story(
+            story_title,
+            tuple(sorted(st.session_state["scenes"].items())),
         )
 
-        if story_title:
-            full_story = f"{story_title}\n\n{full_story}"
-
         st.download_button(
             "📥 Download Complete Story",
             full_story,